@@ -1,23 +1,67 @@
+import asyncio
 from contextlib import asynccontextmanager
+from functools import lru_cache
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from datetime import datetime, timezone
 import os
-import requests
+import time
+import httpx
 from dotenv import load_dotenv
 import re
 import redis
-import json
+import orjson
 
 load_dotenv()
 
 RIOT_API_KEY = os.getenv("RIOT_API_KEY")
-mongo = MongoClient("mongodb://db:27017", serverSelectionTimeoutMS=3000)
+# Wire compression shrinks the repetitive match JSON by several times on
+# the wire; the pool is sized for the app's concurrent handlers.
+mongo = AsyncIOMotorClient(
+    "mongodb://db:27017",
+    serverSelectionTimeoutMS=3000,
+    compressors="zstd,snappy,zlib",
+    maxPoolSize=100,
+    retryReads=True
+)
 db = mongo["riot"]
 
 redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
 
+# Shared async client with HTTP keep-alive and HTTP/2 multiplexing: all Riot
+# traffic goes to a handful of regional hosts, so reusing connections skips
+# the TCP+TLS handshake per call and lets concurrent requests share sockets.
+# Auth via header instead of ?api_key= querystring keeps URLs cache-friendly.
+riot_http = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=5.0,
+    headers={"X-Riot-Token": RIOT_API_KEY or ""}
+)
+
+
+async def check_riot_key():
+    """
+    Verifies the Riot API key against a status endpoint.
+    Uses 'Soft Fail' logic: failures are only logged so the app never
+    enters a crash loop while offline.
+    """
+    try:
+        # Simple check to a status endpoint
+        test_url = "https://euw1.api.riotgames.com/lol/status/v4/platform-data"
+        r = await riot_http.get(test_url)
+        if r.status_code == 200:
+            print("Riot API Key: VALID")
+        else:
+            print(f"Riot API Key Issue: {r.status_code}")
+    except Exception as e:
+        print(f"Network Check Failed (Offline?): {e}")
+        print("Service starting anyway. Will retry connections later.")
+
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
@@ -28,34 +72,78 @@ async def lifespan(_app: FastAPI):
     """
     print("API Service Starting...")
     try:
-        mongo.admin.command('ping')
+        await mongo.admin.command('ping')
         print("MongoDB Connection: OK")
     except Exception as e:
         print(f"MongoDB Connection Failed: {e}")
 
-    try:
-        # Simple check to a status endpoint
-        test_url = f"https://euw1.api.riotgames.com/lol/status/v4/platform-data?api_key={RIOT_API_KEY}"
-        r = requests.get(test_url, timeout=5)
-        if r.status_code == 200:
-            print("Riot API Key: VALID")
-        else:
-            print(f"Riot API Key Issue: {r.status_code}")
-    except Exception as e:
-        print(f"Network Check Failed (Offline?): {e}")
-        print("Service starting anyway. Will retry connections later.")
+    # Compound indexes keep the per-user match fetches an index range scan
+    # instead of a collection scan + in-memory sort; the summonerName_norm
+    # equality lookup replaces the case-insensitive regex scan (sparse:
+    # legacy docs don't have the field yet). One try per index: a single
+    # failure (e.g. the unique matchId index on a legacy DB still holding
+    # duplicates that cleanup_data hasn't removed) must not skip the
+    # remaining indexes and silently leave the name lookups as scans.
+    index_specs = [
+        (db.matches_clean, [("puuid", 1), ("game_timestamp", -1)], {"background": True}),
+        (db.matches_clean, "matchId", {"background": True}),
+        (db.matches_raw, [("puuid", 1), ("timestamp", -1)], {"background": True}),
+        (db.matches_raw, "matchId", {"unique": True}),
+        (db.summoners, "puuid", {"unique": True}),
+        (db.summoners, "summonerName_norm", {"unique": True, "sparse": True}),
+        (db.summoners, "summonerName", {}),
+    ]
+    for coll, keys, kwargs in index_specs:
+        try:
+            await coll.create_index(keys, **kwargs)
+        except Exception as e:
+            print(f"Index Creation Failed ({coll.name}/{keys}): {e}")
+
+    # Run the Riot status check in the background so startup isn't delayed
+    # by up to the request timeout; it also warms the shared TLS pool.
+    check_task = asyncio.create_task(check_riot_key())
 
     yield
     print("API Service Shutting Down...")
+    check_task.cancel()
+    await riot_http.aclose()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 class SummonerRequest(BaseModel):
     name_tag: str
 
 
+def parse_name_tag(s):
+    """
+    Splits a 'Name#Tag' string in a single pass.
+
+    Args:
+        s (str): The raw Name#Tag input.
+
+    Returns:
+        tuple | None: (game_name, tag_line, normalized) where normalized is
+        the lowercased name#tag with spaces removed (the summonerName_norm
+        format), or None if the string has no '#'.
+    """
+    i = s.rfind("#")
+    if i < 0:
+        return None
+    name = s[:i].strip()
+    tag = s[i + 1:].strip()
+    return name, tag, f"{name}#{tag}".lower().replace(" ", "")
+
+
+# Tag line -> (region_routing, platform_id); anything unknown routes to Europe
+_ROUTING = {
+    "KR1": ("asia", "kr"),
+    "NA1": ("americas", "na1"),
+}
+
+
+@lru_cache(maxsize=16)
 def get_routing_info(tag):
     """
     Determines the routing region based on the tag line.
@@ -67,70 +155,176 @@ def get_routing_info(tag):
     Returns:
         tuple: (region_routing, platform_id).
     """
-    tag = tag.upper()
-    if tag == "KR1": return "asia", "kr"
-    if tag == "NA1": return "americas", "na1"
-    return "europe", "euw1"
+    return _ROUTING.get(tag.upper(), ("europe", "euw1"))
+
+
+async def delete_orphans(collection, collection_name):
+    """
+    Deletes matches whose puuid no longer exists in the summoners collection.
+    An aggregation $merge flags every doc server-side ('keep'), so neither
+    the puuid list nor the orphan ids ever travel over the wire; the delete
+    is then a single flag query.
+
+    Args:
+        collection: The matches collection (raw or clean) to clean.
+        collection_name (str): Its name, for the $merge stage.
+
+    Returns:
+        int: Number of orphaned documents deleted.
+    """
+    pipeline = [
+        {"$lookup": {"from": "summoners", "localField": "puuid", "foreignField": "puuid", "as": "s"}},
+        {"$project": {"keep": {"$gt": [{"$size": "$s"}, 0]}}},
+        {"$merge": {"into": collection_name, "on": "_id", "whenMatched": "merge"}}
+    ]
+    # $merge pipelines produce no output docs; draining the cursor runs them
+    await collection.aggregate(pipeline).to_list(length=None)
+    res = await collection.delete_many({"keep": False})
+    await collection.update_many({}, {"$unset": {"keep": ""}})
+    return res.deleted_count
+
+
+# Flush buffered _id deletes once this many ids accumulate, bounding the
+# memory held by maintenance scans while overlapping receive with deletes.
+ID_FLUSH_THRESHOLD = 10_000
+
+
+async def flush_id_deletes(collection, ids):
+    """
+    Deletes the buffered _ids in one call and clears the buffer.
+
+    Args:
+        collection: The collection to delete from.
+        ids (list): Buffered _ids; emptied in place.
+
+    Returns:
+        int: Number of documents deleted.
+    """
+    if not ids:
+        return 0
+    res = await collection.delete_many({"_id": {"$in": ids}})
+    ids.clear()
+    return res.deleted_count
 
 
-def check_db():
+async def trim_excess(collection, ts_field):
+    """
+    Deletes match docs beyond the newest 200 per user in one aggregation.
+    $setWindowFields ranks matches per puuid server-side, replacing the old
+    two-queries-per-user Python loop; ids stream through a bounded buffer
+    instead of being materialized in full.
+
+    Args:
+        collection: The matches collection (raw or clean) to trim.
+        ts_field (str): The timestamp field the collection sorts by.
+
+    Returns:
+        int: Number of excess documents deleted.
+    """
+    pipeline = [
+        {"$setWindowFields": {
+            "partitionBy": "$puuid",
+            "sortBy": {ts_field: -1},
+            "output": {"rnk": {"$rank": {}}}
+        }},
+        {"$match": {"rnk": {"$gt": 200}}},
+        {"$project": {"_id": 1}}
+    ]
+    deleted = 0
+    buffer = []
+    async for doc in collection.aggregate(pipeline, allowDiskUse=True, batchSize=5000):
+        buffer.append(doc["_id"])
+        if len(buffer) >= ID_FLUSH_THRESHOLD:
+            deleted += await flush_id_deletes(collection, buffer)
+    deleted += await flush_id_deletes(collection, buffer)
+    return deleted
+
+
+# Last successful ping (monotonic seconds); a recent success short-circuits
+# the per-request liveness ping so handlers don't pay an extra Mongo RTT.
+_db_last_ok = 0.0
+DB_CHECK_TTL = 5.0
+
+
+async def check_db():
     """
     Health check for MongoDB connection.
+    A success is remembered for a few seconds so the ping round-trip is
+    paid at most once per TTL window instead of once per request.
 
     Returns:
         bool: True if DB is reachable, False otherwise.
     """
+    global _db_last_ok
+    if time.monotonic() - _db_last_ok < DB_CHECK_TTL:
+        return True
     try:
-        mongo.admin.command('ping')
+        await mongo.admin.command('ping')
+        _db_last_ok = time.monotonic()
         return True
     except Exception:
         return False
 
 
 @app.get("/summoners")
-def get_summoners_list():
+async def get_summoners_list():
     """
     Retrieves a list of all tracked summoners from the database.
 
     Returns:
         list: Sorted list of unique summoner names (Name#Tag).
     """
-    if not check_db(): return []
     try:
-        summoners = list(db.summoners.find({}, {"summonerName": 1, "_id": 0}))
-        return sorted(list(set([s["summonerName"] for s in summoners])))
+        cached = redis_client.get("summoners:list")
+        if cached:
+            return orjson.loads(cached)
+    except Exception:
+        pass
+
+    if not await check_db(): return []
+    try:
+        # Dedup + sort happen server-side against the summonerName index,
+        # so only the unique names travel over the wire.
+        pipeline = [
+            {"$group": {"_id": "$summonerName"}},
+            {"$sort": {"_id": 1}}
+        ]
+        names = [doc["_id"] async for doc in db.summoners.aggregate(pipeline)]
+        try:
+            redis_client.set("summoners:list", orjson.dumps(names).decode(), ex=60)
+        except Exception:
+            pass
+        return names
     except Exception:
         return []
 
 
-@app.post("/add_summoner")
-def add_summoner(request: SummonerRequest):
+async def track_summoner(name_tag):
     """
-    Adds a new summoner to the tracking list.
+    Core add logic shared by /add_summoner and /stats?ensure=1.
     1. Verifies existence via Riot Account API.
     2. Saves basic info to MongoDB.
     3. Queues extraction tasks in Redis (split into batches of 50 to avoid rate limits).
 
     Args:
-        request (SummonerRequest): Contains 'name_tag' (Name#Tag).
+        name_tag (str): The Name#Tag to track.
 
     Returns:
         dict: Success message and corrected name.
-    """
-    if not check_db(): raise HTTPException(503, "DB Loading...")
-
-    full_name = request.name_tag
-    if "#" not in full_name: raise HTTPException(400, "Format: Name#Tag")
 
-    tag = full_name.split("#")[-1].strip()
-    game_name = full_name.split("#")[0].strip()
+    Raises:
+        HTTPException: If the format is wrong or Riot rejects the lookup.
+    """
+    parsed = parse_name_tag(name_tag)
+    if not parsed: raise HTTPException(400, "Format: Name#Tag")
+    game_name, tag, _norm = parsed
 
     api_region, platform = get_routing_info(tag)
 
-    acc_url = f"https://{api_region}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{game_name}/{tag}?api_key={RIOT_API_KEY}"
+    acc_url = f"https://{api_region}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{game_name}/{tag}"
 
     try:
-        r = requests.get(acc_url, timeout=5)
+        r = await riot_http.get(acc_url)
     except Exception:
         raise HTTPException(504, "Timeout contacting Riot API")
 
@@ -145,23 +339,26 @@ def add_summoner(request: SummonerRequest):
 
     update_data = {
         "summonerName": real_name,
+        "summonerName_norm": real_name.lower().replace(" ", ""),
         "region": api_region,
     }
 
-    db.summoners.update_one({"puuid": puuid}, {"$set": update_data}, upsert=True)
+    await db.summoners.update_one({"puuid": puuid}, {"$set": update_data}, upsert=True)
 
     try:
         BATCH_SIZE = 50
         TOTAL_GAMES = 200
 
-        for start in range(0, TOTAL_GAMES, BATCH_SIZE):
-            redis_client.lpush("extraction_queue", json.dumps({
-                "action": "extract_batch",
-                "puuid": puuid,
-                "start": start,
-                "count": BATCH_SIZE,
-                "update_profile": (start == 0)  # Only update profile on first batch
-            }))
+        # Single variadic LPUSH: one round-trip to Redis instead of one per batch
+        msgs = [orjson.dumps({
+            "action": "extract_batch",
+            "puuid": puuid,
+            "start": start,
+            "count": BATCH_SIZE,
+            "update_profile": (start == 0)  # Only update profile on first batch
+        }).decode() for start in range(0, TOTAL_GAMES, BATCH_SIZE)]
+        redis_client.lpush("extraction_queue", *msgs)
+        redis_client.delete("summoners:list")
 
     except Exception as e:
         print(f"⚠ Redis Error: {e}")
@@ -172,23 +369,44 @@ def add_summoner(request: SummonerRequest):
     }
 
 
+@app.post("/add_summoner")
+async def add_summoner(request: SummonerRequest):
+    """
+    Adds a new summoner to the tracking list.
+
+    Args:
+        request (SummonerRequest): Contains 'name_tag' (Name#Tag).
+
+    Returns:
+        dict: Success message and corrected name.
+    """
+    if not await check_db(): raise HTTPException(503, "DB Loading...")
+    return await track_summoner(request.name_tag)
+
+
 @app.delete("/summoner/{name_tag}")
-def delete_summoner(name_tag: str):
+async def delete_summoner(name_tag: str):
     """
     Removes a summoner and all associated data (raw matches, clean matches, stats) from the DB.
 
     Args:
         name_tag (str): The summoner name to delete.
     """
-    if not check_db(): raise HTTPException(503, "DB Down")
+    if not await check_db(): raise HTTPException(503, "DB Down")
 
-    clean_search = name_tag.replace(" ", "")
-    if "#" in name_tag:
-        parts = name_tag.split("#")
-        clean_search = f"{parts[0].strip()}#{parts[1].strip()}"
+    parsed = parse_name_tag(name_tag)
+    if parsed:
+        clean_search = f"{parsed[0]}#{parsed[1]}"
+        norm = parsed[2]
+    else:
+        clean_search = name_tag.replace(" ", "")
+        norm = clean_search.lower()
 
-    query = {"summonerName": {"$regex": f"^{re.escape(clean_search)}$", "$options": "i"}}
-    summ = db.summoners.find_one(query)
+    summ = await db.summoners.find_one({"summonerName_norm": norm})
+    if not summ:
+        # Legacy docs written before the normalized field existed
+        query = {"summonerName": {"$regex": f"^{re.escape(clean_search)}$", "$options": "i"}}
+        summ = await db.summoners.find_one(query)
 
     if not summ:
         raise HTTPException(404, "Summoner not found in DB")
@@ -196,16 +414,25 @@ def delete_summoner(name_tag: str):
     puuid = summ.get("puuid")
     name = summ.get("summonerName")
 
-    db.summoners.delete_one({"puuid": puuid})
-    db.matches_raw.delete_many({"puuid": puuid})
-    db.matches_clean.delete_many({"puuid": puuid})
-    db.aggregated_stats.delete_many({"puuid": puuid})
+    # The four deletes are independent; run them concurrently instead of
+    # paying four sequential round-trips.
+    await asyncio.gather(
+        db.summoners.delete_one({"puuid": puuid}),
+        db.matches_raw.delete_many({"puuid": puuid}),
+        db.matches_clean.delete_many({"puuid": puuid}),
+        db.aggregated_stats.delete_many({"puuid": puuid})
+    )
+
+    try:
+        redis_client.delete("summoners:list", f"stats:{puuid}")
+    except Exception:
+        pass
 
     return {"message": f"Deleted {name} and all data."}
 
 
 @app.delete("/maintenance/cleanup")
-def cleanup_data():
+async def cleanup_data():
     """
     Performs database maintenance:
     1. Removes 'orphan' matches (matches where the user is no longer tracked).
@@ -215,75 +442,77 @@ def cleanup_data():
     Returns:
         dict: Summary of deleted records.
     """
-    if not check_db(): raise HTTPException(503, "DB Down")
+    if not await check_db(): raise HTTPException(503, "DB Down")
 
-    valid_puuids = [s["puuid"] for s in db.summoners.find({}, {"puuid": 1})]
-    raw_res = db.matches_raw.delete_many({"puuid": {"$nin": valid_puuids}})
-    # Unused variable clean_res kept for logic completeness, though not returned
-    _clean_res = db.matches_clean.delete_many({"puuid": {"$nin": valid_puuids}})
+    # Orphans are flagged and removed entirely inside Mongo; nothing but the
+    # deleted count crosses the wire.
+    deleted_orphans = await delete_orphans(db.matches_raw, "matches_raw")
+    await delete_orphans(db.matches_clean, "matches_clean")
 
+    # $slice drops the first (kept) id of each duplicate group server-side;
+    # the flattened remainder is deleted in bounded flushes as the cursor
+    # streams, so peak memory stays capped regardless of collection size.
     pipeline = [
         {"$group": {"_id": "$matchId", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
-        {"$match": {"count": {"$gt": 1}}}
+        {"$match": {"count": {"$gt": 1}}},
+        {"$project": {"drop": {"$slice": ["$ids", 1, 100000]}}}
     ]
-    duplicates = list(db.matches_raw.aggregate(pipeline))
     deleted_dupes = 0
-    for doc in duplicates:
-        ids_to_delete = doc['ids'][1:]
-        db.matches_raw.delete_many({"_id": {"$in": ids_to_delete}})
-        deleted_dupes += len(ids_to_delete)
-
-    deleted_excess = 0
-    for puuid in valid_puuids:
-        matches = list(db.matches_raw.find({"puuid": puuid}).sort("timestamp", -1))
-        if len(matches) > 200:
-            to_remove = matches[200:]
-            ids = [m["_id"] for m in to_remove]
-            db.matches_raw.delete_many({"_id": {"$in": ids}})
-            deleted_excess += len(ids)
-
-        c_matches = list(db.matches_clean.find({"puuid": puuid}).sort("game_timestamp", -1))
-        if len(c_matches) > 200:
-            c_to_remove = c_matches[200:]
-            c_ids = [m["_id"] for m in c_to_remove]
-            db.matches_clean.delete_many({"_id": {"$in": c_ids}})
+    buffer = []
+    async for doc in db.matches_raw.aggregate(pipeline, batchSize=5000):
+        buffer.extend(doc["drop"])
+        if len(buffer) >= ID_FLUSH_THRESHOLD:
+            deleted_dupes += await flush_id_deletes(db.matches_raw, buffer)
+    deleted_dupes += await flush_id_deletes(db.matches_raw, buffer)
 
-    try:
-        db.matches_raw.create_index("matchId", unique=True)
-    except Exception:
-        pass
+    # One ranking aggregation per collection replaces the per-user trim loop
+    deleted_excess = await trim_excess(db.matches_raw, "timestamp")
+    await trim_excess(db.matches_clean, "game_timestamp")
 
     return {
         "message": "Deep Clean Successful",
-        "deleted_orphans": raw_res.deleted_count,
+        "deleted_orphans": deleted_orphans,
         "deleted_duplicates": deleted_dupes,
         "trimmed_excess": deleted_excess
     }
 
 
 @app.delete("/maintenance/nuke")
-def nuke_database():
+async def nuke_database():
     """
     DANGER: Deletes ALL data in the database (Users, Matches, Stats).
     Used for factory resets.
     """
-    if not check_db(): raise HTTPException(503, "DB Down")
-    db.summoners.delete_many({})
-    db.matches_raw.delete_many({})
-    db.matches_clean.delete_many({})
-    db.aggregated_stats.delete_many({})
+    if not await check_db(): raise HTTPException(503, "DB Down")
+    await db.summoners.delete_many({})
+    await db.matches_raw.delete_many({})
+    await db.matches_clean.delete_many({})
+    await db.aggregated_stats.delete_many({})
+
+    # Drop the Redis caches too, or /summoners and /stats keep serving the
+    # wiped roster until their TTLs expire.
+    try:
+        redis_client.delete("summoners:list")
+        stats_keys = list(redis_client.scan_iter("stats:*"))
+        if stats_keys:
+            redis_client.delete(*stats_keys)
+    except Exception:
+        pass
+
     return {"message": "Database completely wiped. Ready for fresh start."}
 
 
 @app.get("/refresh")
-def force_refresh():
+async def force_refresh():
     """
     Triggers a manual refresh for ALL tracked users.
     Distributes tasks to Redis in batches of 50 to allow multiple extractors
     to process them in parallel without hitting rate limits.
     """
     try:
-        users = list(db.summoners.find({}, {"puuid": 1, "summonerName": 1}))
+        # Large batch size keeps the full-collection scan to a handful of
+        # getMore round-trips even with many tracked users.
+        users = await db.summoners.find({}, {"puuid": 1, "summonerName": 1}).batch_size(5000).to_list(length=None)
 
         if not users:
             return {"status": "No users to refresh"}
@@ -292,16 +521,37 @@ def force_refresh():
         BATCH_SIZE = 50
         LIMIT_TO_REFRESH = 100
 
+        # Pipeline the fan-out: one socket write per user instead of per batch.
+        # Flush every ~10k buffered commands so a huge user list can't build
+        # an unbounded pipeline in memory.
+        PIPELINE_FLUSH = 10_000
+        pipe = redis_client.pipeline(transaction=False)
+        buffered = 0
         for u in users:
-            for start in range(0, LIMIT_TO_REFRESH, BATCH_SIZE):
-                redis_client.lpush("extraction_queue", json.dumps({
-                    "action": "extract_batch",
-                    "puuid": u["puuid"],
-                    "start": start,
-                    "count": BATCH_SIZE,
-                    "update_profile": (start == 0)
-                }))
-                count += 1
+            user_msgs = [orjson.dumps({
+                "action": "extract_batch",
+                "puuid": u["puuid"],
+                "start": start,
+                "count": BATCH_SIZE,
+                "update_profile": (start == 0)
+            }).decode() for start in range(0, LIMIT_TO_REFRESH, BATCH_SIZE)]
+            pipe.lpush("extraction_queue", *user_msgs)
+            count += len(user_msgs)
+            buffered += 1
+            if buffered >= PIPELINE_FLUSH:
+                pipe.execute()
+                buffered = 0
+        if buffered:
+            pipe.execute()
+
+        # Stamp all users in one unordered bulk_write instead of an
+        # update_one round-trip per user.
+        now = datetime.now(timezone.utc)
+        ops = [UpdateOne({"puuid": u["puuid"]},
+                         {"$set": {"last_refresh_requested": now}},
+                         upsert=True) for u in users]
+        if ops:
+            await db.summoners.bulk_write(ops, ordered=False)
 
         return {"status": f"Distributed {count} batch tasks to Queue"}
     except Exception as e:
@@ -309,55 +559,101 @@ def force_refresh():
 
 
 @app.get("/stats/{summoner}")
-def get_stats(summoner: str):
+async def get_stats(summoner: str, ensure: int = 0):
     """
     Returns the aggregated dashboard data for a specific summoner.
     Includes Profile, Rank, Recent Matches, and Champion Stats.
+    With ensure=1, an unknown Name#Tag is added first and the stats
+    returned in the same call, saving the dashboard two round-trips.
     """
-    if not check_db(): raise HTTPException(503, "DB Down")
-
-    clean_search = summoner.replace(" ", "")
-    if "#" in summoner:
-        parts = summoner.split("#")
-        clean_search = f"{parts[0].strip()}#{parts[1].strip()}"
-
-    query = {"summonerName": {"$regex": f"^{re.escape(clean_search)}$", "$options": "i"}}
-
-    summ = db.summoners.find_one({"summonerName": summoner})
-    if not summ:
-        summ = db.summoners.find_one(query)
+    if not await check_db(): raise HTTPException(503, "DB Down")
+
+    parsed = parse_name_tag(summoner)
+    if parsed:
+        clean_search = f"{parsed[0]}#{parsed[1]}"
+        norm = parsed[2]
+    else:
+        clean_search = summoner.replace(" ", "")
+        norm = clean_search.lower()
+
+    # One round-trip: index seek on the normalized key, with the regex arm
+    # only there to catch legacy docs written before the field existed.
+    lookup = {"$or": [
+        {"summonerName_norm": norm},
+        {"summonerName": {"$regex": f"^{re.escape(clean_search)}$", "$options": "i"}}
+    ]}
+    summ = await db.summoners.find_one(lookup)
+
+    if not summ and ensure and parsed:
+        # Add-then-return: the caller gets stats in the same request instead
+        # of the 404 -> add -> refetch cycle.
+        added = await track_summoner(summoner)
+        real_norm = added["correct_name"].lower().replace(" ", "")
+        summ = await db.summoners.find_one({"summonerName_norm": real_norm})
 
     if not summ: return {"error": "not found"}
 
     puuid = summ.get("puuid")
 
-    matches = list(
-        db.matches_clean.find({"puuid": puuid}, {"_id": 0})
+    # Dashboard polls recompute nothing while the extractor hasn't written
+    # new matches; serve from Redis and let writers invalidate the key.
+    try:
+        cached = redis_client.get(f"stats:{puuid}")
+        if cached:
+            return orjson.loads(cached)
+    except Exception:
+        pass
+
+    # Only ship the fields the dashboard actually renders; batch_size keeps
+    # pymongo from pulling one oversized reply for the whole result set.
+    match_projection = {
+        "_id": 0, "champion": 1, "win": 1, "kills": 1, "deaths": 1, "assists": 1,
+        "kda": 1, "cs": 1, "cs_min": 1, "items": 1, "game_timestamp": 1,
+        "queue_id": 1, "matchId": 1
+    }
+    # Single streaming pass over the cursor: docs are appended as each wire
+    # batch arrives instead of being materialized twice via to_list.
+    cursor = (
+        db.matches_clean.find({"puuid": puuid}, match_projection)
         .sort([("game_timestamp", -1)])
         .limit(300)
+        .batch_size(100)
     )
 
-    agg_dict = {}
-    for m in matches:
-        champ = m.get("champion", "Unknown")
-        if champ not in agg_dict: agg_dict[champ] = {"games": 0, "wins": 0, "k": 0, "d": 0, "a": 0}
-        s = agg_dict[champ]
-        s["games"] += 1
-        if m.get("win"): s["wins"] += 1
-        s["k"] += m.get("kills", 0)
-        s["d"] += m.get("deaths", 0)
-        s["a"] += m.get("assists", 0)
-
-    aggregated = []
-    for champ, s in agg_dict.items():
-        kda = (s["k"] + s["a"]) / max(1, s["d"])
-        winrate = (s["wins"] / s["games"]) * 100
-        aggregated.append({
-            "champion": champ, "games": s["games"], "wins": s["wins"],
-            "winrate": round(winrate, 1), "avg_kda": round(kda, 2)
-        })
+    async def fetch_matches():
+        return [m async for m in cursor]
+
+    # Champion reduction happens server-side: one doc per champion comes back
+    # instead of re-shipping 300 matches just to count them in Python.
+    agg_pipeline = [
+        {"$match": {"puuid": puuid}},
+        {"$sort": {"game_timestamp": -1}},
+        {"$limit": 300},
+        {"$group": {
+            "_id": "$champion",
+            "games": {"$sum": 1},
+            "wins": {"$sum": {"$cond": ["$win", 1, 0]}},
+            "k": {"$sum": "$kills"},
+            "d": {"$sum": "$deaths"},
+            "a": {"$sum": "$assists"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "champion": {"$ifNull": ["$_id", "Unknown"]},
+            "games": 1,
+            "wins": 1,
+            "winrate": {"$round": [{"$multiply": [{"$divide": ["$wins", "$games"]}, 100]}, 1]},
+            "avg_kda": {"$round": [{"$divide": [{"$add": ["$k", "$a"]}, {"$max": ["$d", 1]}]}, 2]}
+        }}
+    ]
+    # The match fetch and the champion aggregation are independent queries;
+    # overlap them instead of paying the two latencies back to back.
+    matches, aggregated = await asyncio.gather(
+        fetch_matches(),
+        db.matches_clean.aggregate(agg_pipeline, allowDiskUse=False).to_list(length=None)
+    )
 
-    return {
+    result = {
         "summoner": summ.get("summonerName"),
         "profile_icon": summ.get("profileIconId", 29),
         "level": summ.get("summonerLevel", 0),
@@ -370,4 +666,32 @@ def get_stats(summoner: str):
         },
         "matches": matches,
         "aggregated": aggregated
-    }
\ No newline at end of file
+    }
+
+    try:
+        redis_client.set(f"stats:{puuid}", orjson.dumps(result).decode(), ex=45)
+    except Exception:
+        pass
+
+    return result
+
+
+@app.get("/match/{match_id}")
+async def get_match_details(match_id: str):
+    """
+    Returns the full participant list for one match.
+    Fetched on demand when the dashboard expands a match's details, so the
+    /stats list payload doesn't carry 10 players' stats per match.
+
+    Args:
+        match_id (str): The Riot match id.
+
+    Returns:
+        dict: {'participants': [...]} (empty list if the match is unknown).
+    """
+    if not await check_db(): raise HTTPException(503, "DB Down")
+
+    doc = await db.matches_clean.find_one({"matchId": match_id}, {"_id": 0, "participants": 1})
+    if not doc:
+        return {"participants": []}
+    return {"participants": doc.get("participants", [])}
@@ -1,22 +1,34 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 from dotenv import load_dotenv
 import os
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
-from datetime import datetime
 import time
 
 load_dotenv()
 API_URL = os.getenv("API_URL", "http://api_service:8000")
 
+# Shared session with keep-alive: every widget interaction reruns the script,
+# so pooled connections to the API service (and CDNs) skip the per-call
+# TCP handshake.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
 st.set_page_config(
     page_title="BaronBatch ETL",
     layout="wide",
     page_icon="assets/logo_small.png" # Loads the logo on the browser tab
 )
 
-st.markdown("""
+# Built once at import; the markdown call below re-emits it each rerun
+# because Streamlit drops elements that a rerun does not produce.
+_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Oswald:wght@300;400;700&display=swap');
 
@@ -131,23 +143,46 @@ st.markdown("""
         background-color: rgba(0,0,0,0.2);
         border: 1px solid #3c1f51;
     }
+
+    .top-champs {
+        width: 100%;
+        border-collapse: collapse;
+        background-color: rgba(0,0,0,0.2);
+        border: 1px solid #3c1f51;
+    }
+    .top-champs th {
+        color: #888;
+        text-transform: uppercase;
+        font-size: 0.8em;
+        text-align: left;
+        padding: 6px 10px;
+        border-bottom: 1px solid #3c1f51;
+    }
+    .top-champs td {
+        padding: 5px 10px;
+        border-bottom: 1px solid rgba(255,255,255,0.05);
+    }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_CSS, unsafe_allow_html=True)
 
 
 # --- ASSETS ---
-@st.cache_data
+@st.cache_data(ttl=3600)
 def get_ddragon_version():
     """
     Fetches the latest Data Dragon version to ensure image assets (items, icons)
     are up-to-date with the current LoL patch.
+    Cached for an hour so reruns don't block on a cross-internet fetch
+    while still picking up new patches the same day they ship.
     Falls back to a safe default if the request fails.
 
     Returns:
         str: Version string (e.g., "14.23.1").
     """
     try:
-        return requests.get("https://ddragon.leagueoflegends.com/api/versions.json", timeout=3).json()[0]
+        return SESSION.get("https://ddragon.leagueoflegends.com/api/versions.json", timeout=3).json()[0]
     except Exception:
         return "14.23.1"
 
@@ -155,6 +190,7 @@ def get_ddragon_version():
 VER = get_ddragon_version()
 
 
+@lru_cache(maxsize=512)
 def get_champ_img(name):
     """
     Returns the CDN URL for a champion's square asset.
@@ -163,22 +199,84 @@ def get_champ_img(name):
     return f"https://cdn.communitydragon.org/latest/champion/{name}/square"
 
 
+@lru_cache(maxsize=512)
 def get_profile_icon(icon_id):
     """
     Returns the CDN URL for a summoner profile icon.
     """
     if not icon_id: icon_id = 29
-    return f"https://ddragon.leagueoflegends.com/cdn/{VER}/img/profileicon/{icon_id}.png"
+    return f"{_ICON_BASE}{icon_id}.png"
 
 
+# Session-constant URL prefixes: VER is fixed once per process, so the
+# f-string work happens here once instead of on every asset-helper call.
+_ITEM_BASE = f"https://ddragon.leagueoflegends.com/cdn/{VER}/img/item/"
+_ICON_BASE = f"https://ddragon.leagueoflegends.com/cdn/{VER}/img/profileicon/"
+_EMPTY_ITEM_IMG = "https://upload.wikimedia.org/wikipedia/commons/c/ca/1x1.png"
+
+
+@lru_cache(maxsize=512)
 def get_item_img(item_id):
     """
     Returns the CDN URL for an in-game item. Returns a transparent pixel if 0 (empty slot).
     """
-    if not item_id or item_id == 0: return "https://upload.wikimedia.org/wikipedia/commons/c/ca/1x1.png"
-    return f"https://ddragon.leagueoflegends.com/cdn/{VER}/img/item/{item_id}.png"
+    if not item_id or item_id == 0: return _EMPTY_ITEM_IMG
+    return f"{_ITEM_BASE}{item_id}.png"
+
+
+@st.cache_data(ttl=3600)
+def get_item_sprites():
+    """
+    Fetches DDragon's item.json once and builds a sprite-sheet lookup so item
+    icons can be rendered as background offsets into a handful of sprite
+    sheets instead of one image request per item. Cached for an hour so
+    the map follows the patch version instead of being pinned forever.
+
+    Returns:
+        dict: {item_id: (sprite_file, x, y, w, h)}.
+    """
+    try:
+        data = SESSION.get(
+            f"https://ddragon.leagueoflegends.com/cdn/{VER}/data/en_US/item.json",
+            timeout=5).json()
+        sprites = {}
+        for item_id, info in data.get("data", {}).items():
+            img = info.get("image") or {}
+            if img.get("sprite"):
+                sprites[int(item_id)] = (img["sprite"], img["x"], img["y"], img["w"], img["h"])
+        return sprites
+    except Exception:
+        return {}
+
+
+ITEM_SPRITES = get_item_sprites()
+
+
+def item_sprite_div(item_id, size=22):
+    """
+    Renders an item icon as a div cropped out of its DDragon sprite sheet.
+    Falls back to a plain <img> for ids missing from the sprite map.
 
+    Args:
+        item_id (int): Riot item id.
+        size (int): Rendered icon size in pixels.
 
+    Returns:
+        str: HTML fragment for the icon.
+    """
+    sprite = ITEM_SPRITES.get(item_id)
+    if not sprite:
+        return f"<img src='{get_item_img(item_id)}' width='{size}' class='item-icon'>"
+    sheet, x, y, w, h = sprite
+    scale = size / w
+    sheet_url = f"https://ddragon.leagueoflegends.com/cdn/{VER}/img/sprite/{sheet}"
+    return (
+        f"<div class='item-icon' style='display:inline-block; overflow:hidden; width:{size}px; height:{size}px;'>"
+        f"<div style='width:{w}px; height:{h}px; transform:scale({scale:.3f}); transform-origin:0 0; "
+        f"background:url({sheet_url}) -{x}px -{y}px;'></div></div>")
+
+
+@lru_cache(maxsize=512)
 def get_rank_emblem(tier):
     """
     Returns the CDN URL for the rank emblem corresponding to the tier (e.g., DIAMOND, GOLD).
@@ -188,46 +286,122 @@ def get_rank_emblem(tier):
     return f"https://raw.communitydragon.org/latest/plugins/rcp-fe-lol-static-assets/global/default/images/ranked-emblem/emblem-{tier.lower()}.png"
 
 
+QUEUE_NAMES = {420: "Ranked Solo", 440: "Ranked Flex", 450: "ARAM", 490: "Quickplay", 1700: "Arena", 1900: "URF"}
+
+
+@lru_cache(maxsize=64)
 def get_queue_name(qid):
     """
     Maps Riot Queue IDs to human-readable names.
     """
-    queues = {420: "Ranked Solo", 440: "Ranked Flex", 450: "ARAM", 490: "Quickplay", 1700: "Arena", 1900: "URF"}
-    return queues.get(qid, f"Queue {qid}")
+    return QUEUE_NAMES.get(qid, f"Queue {qid}")
+
+
+def render_participant_html(p, is_me):
+    """
+    Builds the HTML row for one participant in the match details view.
+
+    Args:
+        p (dict): Participant stats from the clean match document.
+        is_me (bool): Whether this row is the searched player.
+
+    Returns:
+        str: The player-row HTML fragment.
+    """
+    b = "font-weight:bold; color:#fff;" if is_me else ""
+    p_items = "".join(
+        item_sprite_div(it, size=16) for it in p.get('items', ()) if it)
+    p_img = get_champ_img(p.get('champion'))
+    return (
+        f"""<div class='player-row'><div style='display:flex; align-items:center; gap:5px;'><img src='{p_img}' width='20' style='border-radius:50%'><span style='{b}'>{p.get('summonerName')}</span></div><div style='text-align:right'><span>{p.get('kills')}/{p.get('deaths')}/{p.get('assists')}</span><br>{p_items}</div></div>"""
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def render_participants_html(match_id, parts, me_lower):
+    """
+    Builds the blue/red team HTML blocks for one match's scoreboard.
+    match_id is part of the cache key, so reruns that re-open the same
+    match reuse the rendered strings instead of reformatting ten rows.
+
+    Args:
+        match_id (str): Riot match id the participants belong to.
+        parts (list): Participant dicts from the clean match document.
+        me_lower (str): Lowercased game name of the searched player.
+
+    Returns:
+        tuple: (blue_html, red_html).
+    """
+    blue_rows, red_rows = [], []
+    for p in parts:
+        is_me = (p.get('summonerName') or '').split('#')[0].lower() == me_lower
+        row = render_participant_html(p, is_me)
+        (blue_rows if p.get('teamId') == 100 else red_rows).append(row)
+    return "".join(blue_rows), "".join(red_rows)
 
 
 # --- STATE ---
 if 'current_user' not in st.session_state: st.session_state['current_user'] = None
 
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_summoners():
     """
     API Wrapper: Fetches the list of all tracked summoners.
+    Cached for a short TTL so button-triggered reruns don't re-hit the API;
+    deduplicated and sorted at source so callers can use it directly.
     """
     try:
-        return requests.get(f"{API_URL}/summoners", timeout=3).json()
+        data = SESSION.get(f"{API_URL}/summoners", timeout=3).json()
+        if isinstance(data, list):
+            return sorted(set(data))
+        return []
     except Exception:
         return []
 
 
-def try_add_summoner(name):
+def invalidate_summoners():
     """
-    API Wrapper: Sends a request to track a new summoner.
+    Drops the cached summoner list so the next rerun refetches it.
+    Call after any operation that changes the tracked roster.
+    """
+    get_summoners.clear()
 
-    Args:
-        name (str): The Name#Tag to add.
+
+@st.cache_data(ttl=20, show_spinner=False)
+def fetch_stats(name):
+    """
+    API Wrapper: Fetches the stats payload for one summoner. Name#Tag
+    searches pass ensure=1 so unknown players are added and returned in the
+    same call (longer timeout because the add path goes through Riot).
+    Cached briefly so tab switches and expander toggles reuse the payload
+    instead of re-hitting the API.
 
     Returns:
-        tuple: (success (bool), response_json_or_error (dict|str))
+        dict | None: Parsed stats payload, or None if the API is unreachable.
     """
+    safe = urllib.parse.quote(name)
     try:
-        r = requests.post(f"{API_URL}/add_summoner", json={"name_tag": name}, timeout=30)
-        if r.status_code == 200:
-            return True, r.json()
-        else:
-            return False, r.text
-    except Exception as e:
-        return False, f"Error: {str(e)}"
+        if "#" in name:
+            return SESSION.get(f"{API_URL}/stats/{safe}", params={"ensure": 1}, timeout=30).json()
+        return SESSION.get(f"{API_URL}/stats/{safe}", timeout=10).json()
+    except Exception:
+        return None
+
+
+@st.cache_data(ttl=300)
+def get_match_details(match_id):
+    """
+    API Wrapper: Fetches the participant list for one match on demand.
+    Cached so re-opening the same expander doesn't refetch.
+    """
+    if not match_id:
+        return []
+    try:
+        r = SESSION.get(f"{API_URL}/match/{urllib.parse.quote(match_id)}", timeout=5)
+        return r.json().get('participants', [])
+    except Exception:
+        return []
 
 
 def trigger_refresh():
@@ -235,7 +409,7 @@ def trigger_refresh():
     API Wrapper: Triggers the global data refresh job.
     """
     try:
-        requests.get(f"{API_URL}/refresh", timeout=2)
+        SESSION.get(f"{API_URL}/refresh", timeout=2)
         return True
     except Exception:
         return False
@@ -247,7 +421,7 @@ def delete_user(name):
     """
     try:
         safe = urllib.parse.quote(name)
-        r = requests.delete(f"{API_URL}/summoner/{safe}", timeout=5)
+        r = SESSION.delete(f"{API_URL}/summoner/{safe}", timeout=5)
         return r.status_code == 200
     except Exception:
         return False
@@ -258,7 +432,7 @@ def trigger_cleanup():
     API Wrapper: Triggers database maintenance (orphan removal, duplicate check).
     """
     try:
-        r = requests.delete(f"{API_URL}/maintenance/cleanup", timeout=30)
+        r = SESSION.delete(f"{API_URL}/maintenance/cleanup", timeout=30)
         if r.status_code == 200:
             return True, r.json()
         return False, "Error"
@@ -271,12 +445,23 @@ def trigger_nuke():
     API Wrapper: Triggers a complete factory reset of the database.
     """
     try:
-        r = requests.delete(f"{API_URL}/maintenance/nuke", timeout=5)
+        r = SESSION.delete(f"{API_URL}/maintenance/nuke", timeout=5)
         return r.status_code == 200
     except Exception:
         return False
 
 
+# Warm the two independent upstream calls concurrently so a rerun pays
+# max(t_summoners, t_stats) instead of their sum; the call sites below then
+# hit the st.cache_data entries this primes.
+_prefetch_target = st.session_state['current_user']
+with ThreadPoolExecutor(max_workers=2) as _ex:
+    _futures = [_ex.submit(get_summoners)]
+    if _prefetch_target:
+        _futures.append(_ex.submit(fetch_stats, _prefetch_target))
+    for _f in _futures:
+        _f.result()
+
 # --- SIDEBAR ---
 with st.sidebar:
     if os.path.exists("assets/logo.png"):
@@ -286,11 +471,12 @@ with st.sidebar:
 
     st.markdown("### 📂 Players")
     raw_list = get_summoners()
-    if isinstance(raw_list, list):
-        for summ in sorted(list(set(raw_list))):
+    if raw_list:
+        for summ in raw_list:
+            # The button press already triggered this rerun; setting the
+            # state is enough, the main section below reads it in this run.
             if st.button(f"👤 {summ}", key=summ):
                 st.session_state['current_user'] = summ
-                st.rerun()
     else:
         st.warning("Connecting to DB...")
 
@@ -298,7 +484,9 @@ with st.sidebar:
 
     c_ref, c_force = st.columns(2)
     with c_ref:
-        if st.button("🔄 Reload"): st.rerun()
+        if st.button("🔄 Reload"):
+            invalidate_summoners()
+            st.rerun()
     with c_force:
         if st.button("⚡ Update"):
             if trigger_refresh():
@@ -313,6 +501,7 @@ with st.sidebar:
         if st.button("🗑️ Delete User", type="primary", width="stretch"):
             target_to_del = st.session_state['current_user']
             if delete_user(target_to_del):
+                invalidate_summoners()
                 st.session_state['current_user'] = None
                 st.success(f"Deleted {target_to_del}")
                 time.sleep(1)
@@ -337,6 +526,7 @@ with st.sidebar:
         if st.checkbox("Enable Factory Reset"):
             if st.button("💥 FACTORY RESET", type="primary"):
                 if trigger_nuke():
+                    invalidate_summoners()
                     st.session_state['current_user'] = None
                     st.success("Database Wiped! Reloading...")
                     time.sleep(2)
@@ -367,43 +557,59 @@ with c2:
     st.write("");
     st.write("")
     if st.button("🔍 Go", type="primary"):
+        # Explicit searches bypass the short-lived stats cache. No st.rerun
+        # needed: the click already reran the script and the stats section
+        # below picks up the new target in this run.
+        fetch_stats.clear()
         st.session_state['current_user'] = search
-        st.rerun()
 
 target = st.session_state['current_user']
 if not target: st.info("👈 Select a player to start."); st.stop()
 
-safe_name = urllib.parse.quote(target)
-try:
-    res = requests.get(f"{API_URL}/stats/{safe_name}", timeout=10).json()
-except:
+res = fetch_stats(target)
+if res is None:
     st.error("Error connecting to API Service.");
     st.stop()
 
+if 'detail' in res and 'matches' not in res:
+    st.error(res['detail']);
+    st.stop()
+
 if 'error' in res:
-    if "#" in target:
-        with st.status(f"🚀 Adding **{target}**...") as status:
-            ok, response = try_add_summoner(target)
-            if ok:
-                if isinstance(response, dict) and 'correct_name' in response:
-                    st.session_state['current_user'] = response['correct_name']
-
-                status.write(f"✅ Found: {st.session_state['current_user']}")
-                time.sleep(1.5)
-                st.rerun()
-            else:
-                status.update(label="Error", state="error")
-                st.error(response)
-                st.stop()
-    else:
-        st.error("Player not found.");
-        st.stop()
+    st.error("Player not found.");
+    st.stop()
+
+# The API corrects capitalization/spacing; keep the session in sync so the
+# sidebar and search box show the canonical name.
+real_name = res.get('summoner')
+if real_name and real_name != target:
+    # A new player may have been added via ensure=1; refresh the roster.
+    invalidate_summoners()
+    st.session_state['current_user'] = real_name
+    st.rerun()
 
 matches = res.get('matches', [])
 agg = res.get('aggregated', [])
 
+# Format every match date in one vectorized pass; the card builder then
+# reads a precomputed string instead of constructing a datetime per match.
+if matches:
+    _dates = pd.to_datetime(
+        pd.Series([m.get('game_timestamp') for m in matches]),
+        unit='ms', errors='coerce').dt.strftime('%d/%m').fillna('')
+    for m, d in zip(matches, _dates):
+        m['_date_str'] = d
+
+# One pass over the matches: bucket by queue for the tabs and count wins,
+# instead of re-iterating the list once per tab plus once for the winrate.
+queue_buckets = {}
+total_wins = 0
+for m in matches:
+    queue_buckets.setdefault(m.get('queue_id'), []).append(m)
+    if m.get('win'):
+        total_wins += 1
+
 total_games = len(matches)
-total_wins = sum(1 for m in matches if m['win'])
 general_wr = (total_wins / total_games * 100) if total_games > 0 else 0
 wr_color = "#5383e8" if general_wr >= 50 else "#e84057"
 
@@ -468,93 +674,98 @@ with tab_hist:
     t_all, t_solo, t_flex, t_aram = st.tabs(["All", "SoloQ", "Flex", "ARAM"])
 
 
-    def render_list(filtered):
+    def render_list(filtered, tab_key):
         if not filtered:
             st.info("No matches found.")
             return
 
-        cols = st.columns(2)
-        for i, m in enumerate(filtered):
-            with cols[i % 2]:
+        # Precompute the whole card HTML once per match dict; the same dicts
+        # are shared across the All/queue tabs, so this runs once, and each
+        # card is then a single st.markdown call instead of nested columns
+        # plus ~9 component calls (each one a websocket message).
+        for m in filtered:
+            if '_card_html' not in m:
                 win = m['win']
                 css = "win" if win else "loss"
                 result_text = "Victory" if win else "Defeat"
                 color = "#5383e8" if win else "#e84057"
+                champ_url = get_champ_img(m.get('champion'))
+                items_html = "".join(
+                    item_sprite_div(it) for it in m.get('items', ()) if it)
+                q_name = get_queue_name(m.get('queue_id', 0))
+                dt = m.get('_date_str', '')
+                dur = f"{int(m['cs'] / m['cs_min'])}m" if m.get('cs_min') else ""
+                m['_card_html'] = (
+                    f"<div class='match-card {css}'>"
+                    f"<div style='display:flex; align-items:center; gap:10px;'>"
+                    f"<img src='{champ_url}' width='45' style='border-radius:6px;'>"
+                    f"<div style='flex:2;'>"
+                    f"<div class='kda-main'>{m['kills']}/{m['deaths']}/{m['assists']}</div>"
+                    f"<div class='meta'>KDA {m['kda']} • CS {m['cs']}</div>"
+                    f"<div style='margin-top:2px'>{items_html}</div>"
+                    f"</div>"
+                    f"<div style='flex:1.5; text-align:right;'>"
+                    f"<div style='color:{color}; font-weight:bold'>{result_text}</div>"
+                    f"<div class='meta'>{dt} ({dur})</div>"
+                    f"<div class='meta'>{q_name}</div>"
+                    f"</div></div></div>")
+
+        # The searched player's game name, lowercased once; participant rows
+        # compare against it with a plain equality instead of the old
+        # per-participant substring scan of res['summoner'].
+        me_lower = (res.get('summoner') or '').split('#')[0].lower()
 
-                with st.container():
-                    st.markdown(f"<div class='match-card {css}'>", unsafe_allow_html=True)
-                    c1, c2, c3 = st.columns([1, 2, 1.5])
-                    with c1: st.image(get_champ_img(m['champion']), width=45)
-                    with c2:
-                        st.markdown(f"<div class='kda-main'>{m['kills']}/{m['deaths']}/{m['assists']}</div>",
-                                    unsafe_allow_html=True)
-                        st.markdown(f"<div class='meta'>KDA {m['kda']} • CS {m['cs']}</div>", unsafe_allow_html=True)
-                        items_html = "".join(
-                            [f"<img src='{get_item_img(it)}' class='item-icon'>" for it in m.get('items', []) if it])
-                        st.markdown(f"<div style='margin-top:2px'>{items_html}</div>", unsafe_allow_html=True)
-                    with c3:
-                        st.markdown(f"<div style='color:{color}; font-weight:bold'>{result_text}</div>",
-                                    unsafe_allow_html=True)
-                        ts = m.get('game_timestamp', 0)
-                        dt = datetime.fromtimestamp(ts / 1000).strftime('%d/%m') if ts else ""
-                        q_name = get_queue_name(m.get('queue_id', 0))
-                        dur = f"{int(m['cs'] / m['cs_min'])}m" if m.get('cs_min') else ""
-                        st.markdown(f"<div class='meta'>{dt} ({dur})</div>", unsafe_allow_html=True)
-                        st.markdown(f"<div class='meta'>{q_name}</div>", unsafe_allow_html=True)
-                    st.markdown("</div>", unsafe_allow_html=True)
+        cols = st.columns(2)
+        for i, m in enumerate(filtered):
+            with cols[i % 2]:
+                st.markdown(m['_card_html'], unsafe_allow_html=True)
 
                 with st.expander("🔎 Details"):
-                    parts = m.get('participants', [])
-                    if parts:
-                        col_b, col_r = st.columns(2)
-                        with col_b:
-                            st.caption("Blue Team")
-                            for p in parts:
-                                if p.get('teamId') == 100:
-                                    is_me = p.get('summonerName') in res.get('summoner')
-                                    b = "font-weight:bold; color:#fff;" if is_me else ""
-                                    p_items = "".join(
-                                        [f"<img src='{get_item_img(it)}' width='16' style='margin-left:1px'>" for it in
-                                         p.get('items', []) if it])
-                                    p_img = get_champ_img(p.get('champion'))
-                                    st.markdown(
-                                        f"""<div class='player-row'><div style='display:flex; align-items:center; gap:5px;'><img src='{p_img}' width='20' style='border-radius:50%'><span style='{b}'>{p.get('summonerName')}</span></div><div style='text-align:right'><span>{p.get('kills')}/{p.get('deaths')}/{p.get('assists')}</span><br>{p_items}</div></div>""",
-                                        unsafe_allow_html=True)
-                        with col_r:
-                            st.caption("Red Team")
-                            for p in parts:
-                                if p.get('teamId') == 200:
-                                    is_me = p.get('summonerName') in res.get('summoner')
-                                    b = "font-weight:bold; color:#fff;" if is_me else ""
-                                    p_items = "".join(
-                                        [f"<img src='{get_item_img(it)}' width='16' style='margin-left:1px'>" for it in
-                                         p.get('items', []) if it])
-                                    p_img = get_champ_img(p.get('champion'))
-                                    st.markdown(
-                                        f"""<div class='player-row'><div style='display:flex; align-items:center; gap:5px;'><img src='{p_img}' width='20' style='border-radius:50%'><span style='{b}'>{p.get('summonerName')}</span></div><div style='text-align:right'><span>{p.get('kills')}/{p.get('deaths')}/{p.get('assists')}</span><br>{p_items}</div></div>""",
-                                        unsafe_allow_html=True)
+                    # Expander bodies still run on every rerun even when
+                    # collapsed; the toggle (keyed per tab+match, so it
+                    # survives reruns and the same match can appear in both
+                    # the All tab and its queue tab) defers the fetch and
+                    # scoreboard build to the matches the user actually opens.
+                    if st.toggle("Show scoreboard", key=f"det_{tab_key}_{m.get('matchId')}"):
+                        # Slim /stats payloads no longer embed participants;
+                        # fall back to the on-demand endpoint.
+                        parts = m.get('participants') or get_match_details(m.get('matchId'))
+                        if parts:
+                            blue_html, red_html = render_participants_html(
+                                m.get('matchId'), parts, me_lower)
+                            col_b, col_r = st.columns(2)
+                            with col_b:
+                                st.caption("Blue Team")
+                                st.markdown(blue_html, unsafe_allow_html=True)
+                            with col_r:
+                                st.caption("Red Team")
+                                st.markdown(red_html, unsafe_allow_html=True)
 
 
     with t_all:
-        render_list(matches)
+        render_list(matches, "all")
     with t_solo:
-        render_list([m for m in matches if m.get('queue_id') == 420])
+        render_list(queue_buckets.get(420, []), "solo")
     with t_flex:
-        render_list([m for m in matches if m.get('queue_id') == 440])
+        render_list(queue_buckets.get(440, []), "flex")
     with t_aram:
-        render_list([m for m in matches if m.get('queue_id') == 450])
+        render_list(queue_buckets.get(450, []), "aram")
 
 with tab_stats:
     if agg:
         st.subheader("Top Champions")
-        df = pd.DataFrame(agg).sort_values('games', ascending=False)
-        df['Img'] = df['champion'].apply(get_champ_img)
-        st.dataframe(
-            df[['Img', 'champion', 'games', 'winrate', 'avg_kda']],
-            column_config={"Img": st.column_config.ImageColumn(""),
-                           "winrate": st.column_config.NumberColumn("WR%", format="%.1f")},
-            width="stretch",
-            hide_index=True
-        )
+        # The table is a handful of rows; sorting the dicts directly and
+        # emitting one HTML table skips the DataFrame construction, the
+        # .apply over the champion column and st.dataframe's grid widget.
+        rows = sorted(agg, key=lambda a: -a.get('games', 0))[:20]
+        html = ["<table class='top-champs'>",
+                "<tr><th></th><th>Champion</th><th>Games</th><th>WR%</th><th>KDA</th></tr>"]
+        for r in rows:
+            html.append(
+                f"<tr><td><img src='{get_champ_img(r.get('champion'))}' width='24' style='border-radius:4px'></td>"
+                f"<td>{r.get('champion')}</td><td>{r.get('games')}</td>"
+                f"<td>{r.get('winrate', 0):.1f}%</td><td>{r.get('avg_kda', 0):.2f}</td></tr>")
+        html.append("</table>")
+        st.markdown("".join(html), unsafe_allow_html=True)
     else:
         st.info("No data available.")
\ No newline at end of file
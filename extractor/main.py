@@ -1,27 +1,73 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, Response
+import asyncio
+import uuid
 import requests
-from pymongo import MongoClient
+from requests.adapters import HTTPAdapter
+from pymongo import MongoClient, WriteConcern
+from pymongo.errors import BulkWriteError
+from bson import Binary
 import os
+import random
 import time
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 from apscheduler.schedulers.background import BackgroundScheduler
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import sys
+import zlib
 import redis
 import json
+import orjson
 import threading
-from urllib.parse import quote
+from urllib.parse import quote, urlsplit
+from collections import deque
 
 load_dotenv()
 
 RIOT_API_KEY = os.getenv("RIOT_API_KEY", "").strip()
 
-mongo = MongoClient("mongodb://db:27017")
+# Explicit pool sizing plus wire compression: the worker and the scheduler
+# share this client, and compressed frames halve the bytes that bulk match
+# inserts push over the Docker network.
+mongo = MongoClient("mongodb://db:27017", maxPoolSize=50, minPoolSize=10,
+                    compressors="zstd,snappy,zlib", retryWrites=True)
 db = mongo["riot"]
 
+# Bulk raw-match inserts ack on w=1 without waiting for the journal fsync;
+# a batch lost to a crash is simply re-downloaded next cycle, and the
+# unique matchId index keeps the retry idempotent.
+matches_raw_bulk = db.matches_raw.with_options(write_concern=WriteConcern(w=1, j=False))
+
 redis_client = redis.Redis(host='redis', port=6379, db=0, decode_responses=True)
 
+# Shared keep-alive session: every Riot call used to open a fresh TCP+TLS
+# connection, paying a full handshake per request on an RTT-bound workload.
+# Retries stay at 0 because riot_get handles them itself.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=0))
+# Header-based auth: keeps the key out of URLs/logs and keeps URLs stable
+# for caching, instead of appending ?api_key= to every request.
+SESSION.headers.update({"X-Riot-Token": RIOT_API_KEY})
+
+# The transformer only reads these info fields from a raw match; storing a
+# compressed subset instead of the full ~40-80 KB payload shrinks documents
+# roughly tenfold on disk and on the wire.
+SLIM_INFO_FIELDS = ("gameCreation", "gameDuration", "gameEndTimestamp",
+                    "queueId", "participants")
+
+# Fields the batch worker actually reads from a summoner document; the
+# projection keeps the rank blobs and anything else off the wire.
+SUMMONER_PROJECTION = {
+    "_id": 0, "puuid": 1, "summonerName": 1, "region": 1, "platform": 1,
+    "encryptedSummonerId": 1, "last_etag_summoner": 1,
+    "summonerLevel": 1, "profileIconId": 1,
+}
+
+# Ceiling for concurrent match-detail downloads per batch; the actual pool
+# size is tuned at runtime by the AIMD controller below.
+FETCH_WORKERS = 8
+
 # --- REGION MAPPING FOR AUTO-DISCOVERY ---
 # Maps platform ID to the routing value for Match-V5
 PLATFORM_TO_REGION = {
@@ -32,6 +78,17 @@ PLATFORM_TO_REGION = {
 }
 
 
+# URL templates, built once at import; auth travels in the session header
+# so the formatted URLs are stable and log-safe.
+SUMMONER_BY_PUUID_URL = "https://{platform}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}"
+ACCOUNT_BY_RIOT_ID_URL = "https://europe.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{name}/{tag}"
+LEAGUE_ENTRIES_URL = "https://{platform}.api.riotgames.com/lol/league/v4/entries/by-summoner/{enc_id}"
+HIGH_ELO_URL = "https://{platform}.api.riotgames.com/lol/league/v4/{tier}leagues/by-queue/RANKED_SOLO_5x5"
+MATCH_IDS_URL = "https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?start={start}&count={count}"
+MATCH_DETAIL_URL = "https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}"
+STATUS_URL = "https://euw1.api.riotgames.com/lol/status/v4/platform-data"
+
+
 def log(msg):
     """
     Logs a message to stdout and flushes the buffer to ensure immediate output
@@ -44,34 +101,176 @@ def log(msg):
     sys.stdout.flush()
 
 
-def riot_get(url, timeout=10):
+class RiotLimiter:
+    """
+    Proactive sliding-window rate limiter for one Riot platform host.
+
+    Seeded with the development app quota (20/1s, 100/120s) and reseeded
+    from each response's X-App-Rate-Limit header, it blocks callers before
+    a window is exhausted instead of reacting to 429s after the fact.
+    Thread-safe so the batch worker and the detail-fetch pool can share it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {window_seconds: [limit, deque of request timestamps]}
+        self._windows = {1.0: [20, deque()], 120.0: [100, deque()]}
+
+    def wait(self):
+        """
+        Blocks until a slot is free in every window, then claims it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = 0.0
+                for span, (limit, hits) in self._windows.items():
+                    while hits and hits[0] <= now - span:
+                        hits.popleft()
+                    if len(hits) >= limit:
+                        delay = max(delay, hits[0] + span - now)
+                if delay <= 0:
+                    for _span, (_limit, hits) in self._windows.items():
+                        hits.append(now)
+                    return
+            time.sleep(delay)
+
+    def observe(self, headers):
+        """
+        Reseeds the window limits from a response's X-App-Rate-Limit header
+        (e.g. "20:1,100:120"), so production keys widen the quota automatically.
+        """
+        raw = headers.get("X-App-Rate-Limit")
+        if not raw:
+            return
+        try:
+            with self._lock:
+                for part in raw.split(","):
+                    limit, span = part.split(":")
+                    span, limit = float(span), int(limit)
+                    if span in self._windows:
+                        self._windows[span][0] = limit
+                    else:
+                        self._windows[span] = [limit, deque()]
+        except Exception:
+            pass
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease tuner for fetch concurrency.
+
+    Fast successful requests nudge the value up by 0.5; 429s, 5xx and
+    connection errors halve it, TCP-congestion style. Batches size their
+    detail-fetch pool from the current value, so the extractor self-tunes
+    to whatever load Riot is tolerating instead of using a fixed pool.
+    """
+
+    def __init__(self, initial=4.0, floor=1, ceiling=FETCH_WORKERS, latency_target=1.0):
+        self._lock = threading.Lock()
+        self._value = initial
+        self._floor = floor
+        self._ceiling = ceiling
+        self._latency_target = latency_target
+
+    def record(self, ok, latency=0.0):
+        """
+        Feeds one request outcome into the controller.
+
+        Args:
+            ok (bool): Whether the request returned 200.
+            latency (float, optional): Wall time of the request in seconds.
+        """
+        with self._lock:
+            if ok and latency <= self._latency_target:
+                self._value = min(self._ceiling, self._value + 0.5)
+            elif not ok:
+                self._value = max(self._floor, self._value * 0.5)
+
+    @property
+    def workers(self):
+        """
+        Current pool size: the controller value floored to an int.
+        """
+        with self._lock:
+            return max(self._floor, int(self._value))
+
+
+CONTROLLER = AIMDController()
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(url):
+    """
+    Returns the limiter for a URL's host; Riot quotas are per region host.
+    """
+    host = urlsplit(url).netloc
+    with _LIMITERS_LOCK:
+        if host not in _LIMITERS:
+            _LIMITERS[host] = RiotLimiter()
+        return _LIMITERS[host]
+
+
+def riot_get(url, timeout=10, max_attempts=3):
     """
     Performs a GET request to the Riot API with error handling and rate limit retries.
+    On 429 it honors the Retry-After header with full jitter instead of a
+    fixed two-minute sleep; 5xx and connection errors retry with capped
+    exponential backoff. Attempts are bounded so a dead endpoint cannot
+    recurse forever.
 
     Args:
         url (str): The Riot API URL to request.
         timeout (int, optional): Request timeout in seconds. Defaults to 10.
+        max_attempts (int, optional): Total tries before giving up. Defaults to 3.
 
     Returns:
         dict | list | None: The JSON response if successful, otherwise None.
     """
-    try:
-        r = requests.get(url, timeout=timeout)
-        if r.status_code == 429:
-            log("⏳ Rate Limit (429). Sleeping 2min...")
-            time.sleep(120)
-            return riot_get(url, timeout)
-        if r.status_code == 200: return r.json()
+    limiter = get_limiter(url)
+    for attempt in range(max_attempts):
+        limiter.wait()
+        start_t = time.monotonic()
+        try:
+            r = SESSION.get(url, timeout=timeout)
+        except Exception as e:
+            CONTROLLER.record(False)
+            log(f"⚠ Request Exception: {e}")
+            time.sleep(min(30, 2 ** attempt) * random.random())
+            continue
 
-        if r.status_code >= 400:
-            log(f"⚠ API Error {r.status_code}: {url}")
-            try:
-                log(f"   Reason: {r.text}")
-            except Exception:
-                pass
+        latency = time.monotonic() - start_t
+        limiter.observe(r.headers)
+        if r.status_code == 200:
+            CONTROLLER.record(True, latency)
+            # Match payloads are ~300 KB of nested JSON; orjson parses the
+            # raw bytes several times faster than Response.json().
+            return orjson.loads(r.content)
 
-    except Exception as e:
-        log(f"⚠ Request Exception: {e}")
+        if r.status_code == 429:
+            CONTROLLER.record(False)
+            try:
+                retry = int(r.headers.get("Retry-After", "1"))
+            except ValueError:
+                retry = 1
+            wait = retry + random.uniform(0, retry)
+            log(f"⏳ Rate Limit (429). Backing off {wait:.1f}s...")
+            time.sleep(wait)
+            continue
+
+        if r.status_code >= 500:
+            CONTROLLER.record(False)
+            time.sleep(min(30, 2 ** attempt) * random.random())
+            continue
+
+        log(f"⚠ API Error {r.status_code}: {url}")
+        try:
+            log(f"   Reason: {r.text}")
+        except Exception:
+            pass
+        return None
     return None
 
 
@@ -133,9 +332,10 @@ def auto_detect_correct_region(puuid, current_platform):
     platforms_to_try = [p for p in PLATFORM_TO_REGION.keys() if p != current_platform]
 
     for plt in platforms_to_try:
-        url = f"https://{plt}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}?api_key={RIOT_API_KEY}"
+        url = SUMMONER_BY_PUUID_URL.format(platform=plt, puuid=puuid)
         try:
-            r = requests.get(url, timeout=5)
+            get_limiter(url).wait()
+            r = SESSION.get(url, timeout=5)
             if r.status_code == 200:
                 new_reg = PLATFORM_TO_REGION[plt]
                 log(f"Found user on {plt} ({new_reg})!")
@@ -143,7 +343,6 @@ def auto_detect_correct_region(puuid, current_platform):
                 return plt, new_reg
         except Exception:
             pass
-        time.sleep(0.1)
 
     log("Could not find user on ANY region.")
     return None, None
@@ -166,7 +365,7 @@ def get_local_puuid(name, tag):
 
     safe_name = quote(name)
     safe_tag = quote(tag)
-    url = f"https://europe.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{safe_name}/{safe_tag}?api_key={RIOT_API_KEY}"
+    url = ACCOUNT_BY_RIOT_ID_URL.format(name=safe_name, tag=safe_tag)
 
     data = riot_get(url)
     if data and "puuid" in data:
@@ -174,23 +373,49 @@ def get_local_puuid(name, tag):
     return None
 
 
-def update_basic_summoner_info(puuid, platform, name):
+# Sentinel returned (in the id slot) by update_basic_summoner_info when the
+# conditional fetch came back 304. Distinct from None so callers can tell
+# "profile unchanged" apart from "profile fetch failed".
+PROFILE_UNCHANGED = object()
+
+
+def update_basic_summoner_info(puuid, platform, name, summ=None):
     """
-    Updates the summoner's basic profile information (level, icon, encrypted ID) in the DB.
-    Handles automatic region detection and key mismatch scenarios.
+    Fetches the summoner's basic profile information (level, icon) from Riot.
+    Handles automatic region detection and key mismatch scenarios. The caller
+    merges the returned fields into its single per-summoner write; fields
+    already matching the in-memory document are dropped so unchanged
+    profiles cost no write at all.
 
     Args:
         puuid (str): The PUUID currently stored in the DB.
         platform (str): The platform ID (e.g., 'euw1').
         name (str): The summoner's full name (for logging/recovery).
+        summ (dict, optional): The summoner document already loaded from the DB.
 
     Returns:
-        tuple: (success (bool), encrypted_summoner_id (str|None)).
+        tuple: (update_data (dict|None), encrypted_summoner_id). The second
+            element is PROFILE_UNCHANGED on a 304 and None on failure.
     """
-    url = f"https://{platform}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}?api_key={RIOT_API_KEY}"
-
-    # 1. Try Standard Request
-    r = requests.get(url)
+    url = SUMMONER_BY_PUUID_URL.format(platform=platform, puuid=puuid)
+
+    # 1. Try Standard Request (conditional: send the stored ETag so an
+    # unchanged profile comes back as a bodyless 304).
+    headers = {}
+    if summ and summ.get("last_etag_summoner"):
+        headers["If-None-Match"] = summ["last_etag_summoner"]
+    # Conditional headers keep these off riot_get, but they still spend
+    # app-rate-limit quota and must go through the limiter like every
+    # other Riot call (a 304 costs quota too).
+    get_limiter(url).wait()
+    r = SESSION.get(url, headers=headers, timeout=10)
+    get_limiter(url).observe(r.headers)
+
+    if r.status_code == 304:
+        # Profile unchanged since the stored ETag: no body, no parse, no
+        # write. This says nothing about rank, so the caller gets a distinct
+        # sentinel instead of the (None, None) failure shape.
+        return None, PROFILE_UNCHANGED
 
     # 2. HANDLE KEY MISMATCH (The Fix)
     if r.status_code == 400 and "Exception decrypting" in r.text:
@@ -205,41 +430,52 @@ def update_basic_summoner_info(puuid, platform, name):
         local_puuid = get_local_puuid(g_name, t_line)
 
         if local_puuid:
-            url = f"https://{platform}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{local_puuid}?api_key={RIOT_API_KEY}"
-            r = requests.get(url)
+            url = SUMMONER_BY_PUUID_URL.format(platform=platform, puuid=local_puuid)
+            get_limiter(url).wait()
+            r = SESSION.get(url, timeout=10)
+            get_limiter(url).observe(r.headers)
 
     # 3. Handle Auto-Detect
     if r.status_code == 404:
         new_plt, new_reg = auto_detect_correct_region(puuid, platform)
         if new_plt:
-            url = f"https://{new_plt}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}?api_key={RIOT_API_KEY}"
-            r = requests.get(url)
+            url = SUMMONER_BY_PUUID_URL.format(platform=new_plt, puuid=puuid)
+            get_limiter(url).wait()
+            r = SESSION.get(url, timeout=10)
+            get_limiter(url).observe(r.headers)
 
-    data = r.json() if r.status_code == 200 else None
+    data = orjson.loads(r.content) if r.status_code == 200 else None
 
     if data:
         update_data = {
             "summonerLevel": data.get("summonerLevel", 0),
             "profileIconId": data.get("profileIconId", 29),
-            # Important: We do NOT update 'encryptedSummonerId' here because
-            # it might be encrypted for Key #2, but we want the DB to look like Key #1.
+            # Safe to persist: every response here was fetched with this
+            # service's own key (the mismatch path re-resolves the puuid
+            # with it first), so the id is decryptable by us. Storing it
+            # keeps the fast rank path working on later 304 cycles.
+            "encryptedSummonerId": data.get("id"),
         }
-        db.summoners.update_one({"puuid": puuid}, {"$set": update_data})
-        return True, data.get("id")
+        etag = r.headers.get("ETag")
+        if etag:
+            update_data["last_etag_summoner"] = etag
+        if summ:
+            update_data = {k: v for k, v in update_data.items() if summ.get(k) != v}
+        return (update_data or None), data.get("id")
 
-    return False, None
+    return None, None
 
 
-def update_db_rank_data(puuid, solo_data):
+def build_rank_update(solo_data):
     """
-    Updates the summoner's Ranked Solo queue statistics in the database.
+    Builds the Ranked Solo queue fields for the summoner document. The
+    caller merges them into its single per-summoner write.
 
     Args:
-        puuid (str): The summoner's PUUID.
         solo_data (dict): The dictionary containing rank information from Riot API.
 
     Returns:
-        bool: Always True.
+        dict: The rank fields to $set.
     """
     if not solo_data: solo_data = {}
     rank_data = {
@@ -250,11 +486,10 @@ def update_db_rank_data(puuid, solo_data):
         "solo_wins": solo_data.get('wins', 0),
         "solo_losses": solo_data.get('losses', 0),
     }
-    db.summoners.update_one({"puuid": puuid}, {"$set": rank_data})
     if solo_data.get('tier'):
         rank_display = f"{solo_data.get('tier')} {solo_data.get('rank', '')}"
         log(f"RANK OK: {rank_display}")
-    return True
+    return rank_data
 
 
 def fetch_and_update_rank_fast(enc_id, platform, puuid, _name):
@@ -268,20 +503,75 @@ def fetch_and_update_rank_fast(enc_id, platform, puuid, _name):
         _name (str): Unused parameter (name).
 
     Returns:
-        bool: True if data was found and updated, False otherwise.
+        dict | None: Rank update fields if the lookup succeeded, else None.
     """
-    league_url = f"https://{platform}.api.riotgames.com/lol/league/v4/entries/by-summoner/{enc_id}?api_key={RIOT_API_KEY}"
+    league_url = LEAGUE_ENTRIES_URL.format(platform=platform, enc_id=enc_id)
     data = riot_get(league_url)
     if data is not None:
         solo = next((l for l in data if l['queueType'] == 'RANKED_SOLO_5x5'), None)
-        if solo or not data: return update_db_rank_data(puuid, solo)
-    return False
+        if solo or not data: return build_rank_update(solo)
+    return None
+
+
+# (platform, tier) -> (expires_at, {puuid: entry}). The three high-elo league
+# lists are identical for every summoner in a cycle, so each is fetched at
+# most once per TTL and indexed by puuid for O(1) lookups. A Redis layer
+# underneath shares the download between the two extractor containers.
+_HIGH_ELO_CACHE = {}
+_HIGH_ELO_TTL = 300
+_HIGH_ELO_LOCK = threading.Lock()
+
+
+def get_high_elo_entries(platform, tier):
+    """
+    Returns the {puuid: entry} table for one high-elo league list, cached
+    for five minutes (_HIGH_ELO_TTL) per platform.
+
+    Args:
+        platform (str): The platform ID (e.g., 'euw1').
+        tier (str): CHALLENGER, GRANDMASTER or MASTER.
+
+    Returns:
+        dict: League entries keyed by puuid (empty on fetch failure).
+    """
+    key = (platform, tier)
+    now = time.monotonic()
+    with _HIGH_ELO_LOCK:
+        cached = _HIGH_ELO_CACHE.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    # Second level: another extractor container may have fetched the list
+    # within the TTL already.
+    redis_key = f"riot:league:{platform}:{tier}"
+    entries = None
+    try:
+        payload = redis_client.get(redis_key)
+        if payload:
+            entries = json.loads(payload)
+    except Exception:
+        entries = None
+
+    if entries is None:
+        url = HIGH_ELO_URL.format(platform=platform, tier=tier.lower())
+        data = riot_get(url)
+        entries = {}
+        if data and 'entries' in data:
+            entries = {e.get("puuid"): e for e in data['entries']}
+            try:
+                redis_client.setex(redis_key, _HIGH_ELO_TTL, json.dumps(entries))
+            except Exception:
+                pass
+
+    with _HIGH_ELO_LOCK:
+        _HIGH_ELO_CACHE[key] = (now + _HIGH_ELO_TTL, entries)
+    return entries
 
 
 def fetch_rank_advanced(puuid, platform, name):
     """
-    Fallback method to find high-elo players by iterating through Challenger/GM/Master lists
-    if the direct lookup fails.
+    Fallback method to find high-elo players in the cached Challenger/GM/Master
+    tables if the direct lookup fails.
 
     Args:
         puuid (str): The summoner's PUUID.
@@ -289,37 +579,26 @@ def fetch_rank_advanced(puuid, platform, name):
         name (str): The summoner's name.
 
     Returns:
-        bool: Always True.
+        dict: Rank update fields (UNRANKED if the player is in no list).
     """
     tiers_high_elo = ["CHALLENGER", "GRANDMASTER", "MASTER"]
     for tier in tiers_high_elo:
-        url = f"https://{platform}.api.riotgames.com/lol/league/v4/{tier.lower()}leagues/by-queue/RANKED_SOLO_5x5?api_key={RIOT_API_KEY}"
-        if tier == "CHALLENGER":
-            url = f"https://{platform}.api.riotgames.com/lol/league/v4/challengerleagues/by-queue/RANKED_SOLO_5x5?api_key={RIOT_API_KEY}"
-        elif tier == "GRANDMASTER":
-            url = f"https://{platform}.api.riotgames.com/lol/league/v4/grandmasterleagues/by-queue/RANKED_SOLO_5x5?api_key={RIOT_API_KEY}"
-        elif tier == "MASTER":
-            url = f"https://{platform}.api.riotgames.com/lol/league/v4/masterleagues/by-queue/RANKED_SOLO_5x5?api_key={RIOT_API_KEY}"
-        data = riot_get(url)
-        if data and 'entries' in data:
-            for entry in data['entries']:
-                if entry.get("puuid") == puuid:
-                    update_data = {
-                        'tier': tier,
-                        'rank': entry.get('rank', 'I'),
-                        'leaguePoints': entry.get('leaguePoints', 0),
-                        'wins': entry.get('wins', 0),
-                        'losses': entry.get('losses', 0)
-                    }
-                    update_db_rank_data(puuid, update_data)
-                    log(f"FOUND in {tier}: {name}")
-                    return True
-    update_db_rank_data(puuid, {'tier': 'UNRANKED'})
-    return True
+        entry = get_high_elo_entries(platform, tier).get(puuid)
+        if entry:
+            update_data = {
+                'tier': tier,
+                'rank': entry.get('rank', 'I'),
+                'leaguePoints': entry.get('leaguePoints', 0),
+                'wins': entry.get('wins', 0),
+                'losses': entry.get('losses', 0)
+            }
+            log(f"FOUND in {tier}: {name}")
+            return build_rank_update(update_data)
+    return build_rank_update({'tier': 'UNRANKED'})
 
 
 # --- BATCH LOGIC ---
-def run_batch_extraction(puuid, start, count, update_profile=False):
+def run_batch_extraction(puuid, start, count, update_profile=False, summ=None):
     """
     Executes the core extraction logic for a specific batch of matches.
     Handles profile updates, PUUID translation (Key Mismatch), and downloading match data.
@@ -329,9 +608,11 @@ def run_batch_extraction(puuid, start, count, update_profile=False):
         start (int): The match history start index.
         count (int): The number of matches to fetch.
         update_profile (bool, optional): Whether to also update summoner profile/rank. Defaults to False.
+        summ (dict, optional): Pre-fetched summoner document; skips the lookup when given.
     """
     # 1. Get Basic Info from DB using the ORIGINAL PUUID (DB Key)
-    summ = db.summoners.find_one({"puuid": puuid})
+    if summ is None:
+        summ = db.summoners.find_one({"puuid": puuid}, SUMMONER_PROJECTION)
     if not summ:
         log(f"User not found in DB: {puuid}")
         return
@@ -349,6 +630,10 @@ def run_batch_extraction(puuid, start, count, update_profile=False):
         platform, region = db_platform, db_region
     else:
         platform, region = get_region_and_platform(full_name)
+        # Persist the derived routing so future cycles read it off the
+        # document instead of re-parsing the tag every batch.
+        db.summoners.update_one(
+            {"puuid": puuid}, {"$set": {"platform": platform, "region": region}})
 
     # --- PUUID CONTEXT SWITCHING ---
     working_puuid = puuid
@@ -356,25 +641,43 @@ def run_batch_extraction(puuid, start, count, update_profile=False):
     # 2. Update Profile & Rank (ONLY IF REQUESTED)
     if update_profile:
         log(f"Checking Profile: {full_name}")
-        is_ok, fetched_id = update_basic_summoner_info(puuid, platform, full_name)
+        profile_set = {}
+        basic, fetched_id = update_basic_summoner_info(puuid, platform, full_name, summ)
+        if basic:
+            profile_set.update(basic)
 
         # Refetch just in case region changed
-        summ = db.summoners.find_one({"puuid": puuid})
+        summ = db.summoners.find_one({"puuid": puuid}, SUMMONER_PROJECTION)
         if summ.get("platform"): platform = summ.get("platform")
 
-        saved_id = summ.get("encryptedSummonerId") or fetched_id
-
-        rank_updated = False
-        if saved_id: rank_updated = fetch_and_update_rank_fast(saved_id, platform, puuid, full_name)
-        if not rank_updated: fetch_rank_advanced(puuid, platform, full_name)
+        profile_unchanged = fetched_id is PROFILE_UNCHANGED
+        saved_id = summ.get("encryptedSummonerId") or (
+            None if profile_unchanged else fetched_id)
+
+        rank = None
+        if saved_id: rank = fetch_and_update_rank_fast(saved_id, platform, puuid, full_name)
+        if rank is None and not profile_unchanged:
+            # Only fall back to the high-elo tables when the profile fetch
+            # actually ran: a 304 means the profile is unchanged, not that
+            # the player is unranked, and the fallback's UNRANKED default
+            # would wipe a real rank on every steady-state cycle.
+            rank = fetch_rank_advanced(puuid, platform, full_name)
+        if rank:
+            profile_set.update(rank)
+
+        # One write per summoner instead of one per helper.
+        if profile_set:
+            db.summoners.update_one({"puuid": puuid}, {"$set": profile_set})
 
     # 3. Fetch Matches (Specific Batch)
     log(f"{full_name}: Fetching batch {start}-{start + count} (Region: {region})...")
 
-    ids_url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{working_puuid}/ids?start={start}&count={count}&api_key={RIOT_API_KEY}"
+    ids_url = MATCH_IDS_URL.format(region=region, puuid=working_puuid, start=start, count=count)
 
     try:
-        r = requests.get(ids_url, timeout=10)
+        get_limiter(ids_url).wait()
+        r = SESSION.get(ids_url, timeout=10)
+        get_limiter(ids_url).observe(r.headers)
 
         # CATCH THE KEY MISMATCH HERE
         if r.status_code == 400 and "Exception decrypting" in r.text:
@@ -384,22 +687,29 @@ def run_batch_extraction(puuid, start, count, update_profile=False):
 
             if new_local_puuid:
                 working_puuid = new_local_puuid
-                ids_url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{working_puuid}/ids?start={start}&count={count}&api_key={RIOT_API_KEY}"
-                r = requests.get(ids_url, timeout=10)
+                ids_url = MATCH_IDS_URL.format(region=region, puuid=working_puuid, start=start, count=count)
+                get_limiter(ids_url).wait()
+                r = SESSION.get(ids_url, timeout=10)
+                get_limiter(ids_url).observe(r.headers)
             else:
                 log("Failed to resolve local PUUID. Aborting batch.")
                 return
 
         if r.status_code == 429:
-            log("⏳ Rate Limit (429). Sleeping 2min...")
-            time.sleep(120)
+            try:
+                retry = int(r.headers.get("Retry-After", "1"))
+            except ValueError:
+                retry = 1
+            wait = retry + random.uniform(0, retry)
+            log(f"⏳ Rate Limit (429). Backing off {wait:.1f}s...")
+            time.sleep(wait)
             return run_batch_extraction(puuid, start, count, update_profile)
 
         if r.status_code != 200:
             log(f"⚠ Match fetch failed: {r.status_code}")
             return
 
-        match_ids = r.json()
+        match_ids = orjson.loads(r.content)
 
     except Exception as e:
         log(f"⚠ Request Exception: {e}")
@@ -408,34 +718,55 @@ def run_batch_extraction(puuid, start, count, update_profile=False):
     if not match_ids or not isinstance(match_ids, list):
         return
 
-    new_in_batch = 0
-    for match_id in match_ids:
-        exists = db.matches_raw.find_one({"matchId": match_id})
-        if exists: continue
+    def fetch_detail(m_id):
+        """Fetches one match payload; returns (match_id, data or None)."""
+        m_url = MATCH_DETAIL_URL.format(region=region, match_id=m_id)
+        return m_id, riot_get(m_url)
 
-        m_url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}?api_key={RIOT_API_KEY}"
-        data = riot_get(m_url)
+    # One index-covered $in lookup replaces a find_one round trip per id.
+    existing = {d["matchId"] for d in db.matches_raw.find(
+        {"matchId": {"$in": match_ids}}, {"matchId": 1, "_id": 0})}
+    missing = [m for m in match_ids if m not in existing]
 
-        if data:
-            try:
+    new_in_batch = 0
+    if missing:
+        # Downloads run concurrently; docs are collected and written in one
+        # unordered insert_many instead of a round trip per match. The
+        # unique matchId index drops racing duplicates on partial success.
+        pending = []
+        with ThreadPoolExecutor(max_workers=CONTROLLER.workers) as pool:
+            for match_id, data in pool.map(fetch_detail, missing):
+                if not data:
+                    continue
+                info = data.get("info") or {}
+                slim = {"info": {k: info.get(k) for k in SLIM_INFO_FIELDS}}
                 # SAVE WITH ORIGINAL PUUID
-                db.matches_raw.insert_one({
+                pending.append({
                     "matchId": match_id,
                     "puuid": puuid,
-                    "raw": data,
+                    "raw_z": Binary(zlib.compress(orjson.dumps(slim), 6)),
                     "processed": False,
                     "timestamp": datetime.now(timezone.utc)
                 })
-                new_in_batch += 1
+        if pending:
+            try:
+                result = matches_raw_bulk.insert_many(pending, ordered=False)
+                new_in_batch = len(result.inserted_ids)
+            except BulkWriteError as e:
+                new_in_batch = e.details.get("nInserted", 0)
             except Exception:
                 pass
-            time.sleep(0.1)
 
     if new_in_batch > 0:
         log(f"{full_name}: Downloaded {new_in_batch} new matches (Batch {start}) via Extractor")
+        # Invalidate the API service's cached /stats payload for this user
+        try:
+            redis_client.delete(f"stats:{puuid}")
+        except Exception:
+            pass
 
 
-def run_extraction_job(limit=100, target_puuid=None):
+def run_extraction_job(limit=100, target_puuid=None, job_id=None, only_stale=False):
     """
     Scheduled job creator. Finds users in the DB and pushes extraction tasks to Redis.
     Splits larger limits into chunks of 50 to respect rate limits.
@@ -443,52 +774,136 @@ def run_extraction_job(limit=100, target_puuid=None):
     Args:
         limit (int, optional): Total matches to check per user. Defaults to 100.
         target_puuid (str, optional): If provided, only runs for this specific user. Defaults to None.
+        job_id (str, optional): If provided, a pending-task counter is kept in
+            Redis so /trigger_extract/{job_id}/wait can long-poll completion.
+        only_stale (bool, optional): Sweep only users not refreshed in the
+            last 30 minutes (used by the scheduled cycle). Defaults to False.
     """
-    query = {"puuid": target_puuid} if target_puuid else {}
-    users = list(db.summoners.find(query, {"puuid": 1}))
+    if only_stale:
+        # Overlap guard for the scheduled sweep only: if the worker is
+        # still draining the previous cycle's tasks, enqueueing another
+        # full sweep only piles up duplicate work and connection spikes.
+        # Manual triggers always enqueue, so their job counter exists and
+        # /trigger_extract/{job_id}/wait never sees an unknown job.
+        try:
+            if redis_client.llen("extraction_queue") > 0:
+                log("Extraction queue still busy. Skipping this cycle.")
+                return
+        except Exception:
+            pass
+
+    if target_puuid:
+        # Single-user triggers need no DB read here at all: only the puuid
+        # goes on the queue and the batch worker loads and validates the
+        # document itself (over the unique puuid index).
+        users = [{"puuid": target_puuid}]
+    else:
+        query = {}
+        if only_stale:
+            # Most users don't play a new game every cycle; the scheduled
+            # sweep skips anyone refreshed within the last half hour.
+            cutoff = datetime.now(timezone.utc) - timedelta(minutes=30)
+            query = {"$or": [{"last_rank_update": {"$exists": False}},
+                             {"last_rank_update": {"$lt": cutoff}}]}
+        users = list(db.summoners.find(query, {"puuid": 1}))
 
     # Batch size consistent with API Service to respect rate limits
     BATCH_SIZE = 50
 
+    tasks = []
     for u in users:
         # Loop through the limit in steps of BATCH_SIZE
         for start in range(0, limit, BATCH_SIZE):
             current_count = min(BATCH_SIZE, limit - start)
 
-            redis_client.lpush("extraction_queue", json.dumps({
+            tasks.append({
                 "action": "extract_batch",
                 "puuid": u["puuid"],
                 "start": start,
                 "count": current_count,
                 # Only update profile on the first batch
-                "update_profile": (start == 0)
-            }))
+                "update_profile": (start == 0),
+                "job_id": job_id
+            })
+
+    # The counter must exist before the first task is enqueued, otherwise a
+    # fast worker could decrement a key that is not there yet.
+    if job_id:
+        redis_client.set(f"job:{job_id}:pending", len(tasks), ex=3600)
+
+    for task in tasks:
+        redis_client.lpush("extraction_queue", json.dumps(task))
 
 
 # --- WORKER ---
+def drain_queue(max_extra=99):
+    """
+    Atomically drains up to max_extra additional tasks from the queue so a
+    refresh fan-out is consumed as one batch instead of task-by-task.
+
+    Args:
+        max_extra (int, optional): Max tasks to drain beyond the blpop one.
+
+    Returns:
+        list: Decoded task dicts (empty if the queue was already drained).
+    """
+    try:
+        pipe = redis_client.pipeline()
+        pipe.lrange("extraction_queue", 0, max_extra - 1)
+        pipe.ltrim("extraction_queue", max_extra, -1)
+        raw_tasks, _ = pipe.execute()
+        return [json.loads(t) for t in raw_tasks]
+    except Exception:
+        return []
+
+
 def redis_worker():
     """
     Background worker thread that continually pulls tasks from the 'extraction_queue'
-    in Redis and executes them using run_batch_extraction.
+    in Redis and executes them using run_batch_extraction. Tasks are drained
+    in batches and their summoner documents pre-fetched with one $in read.
     """
     log("Redis Worker Listening...")
     while True:
         try:
             _, data = redis_client.blpop("extraction_queue")
-            task = json.loads(data)
-            action = task.get("action")
-
-            if action == "extract_batch":
-                puuid = task.get("puuid")
-                start = task.get("start", 0)
-                count = task.get("count", 100)
-                update_p = task.get("update_profile", False)
-
-                run_batch_extraction(puuid, start, count, update_p)
-
-            elif action == "refresh_all":
-                limit = task.get("limit", 100)
-                run_extraction_job(limit)
+            tasks = [json.loads(data)] + drain_queue()
+
+            puuids = {t.get("puuid") for t in tasks
+                      if t.get("action") == "extract_batch" and t.get("puuid")}
+            summ_docs = {}
+            if puuids:
+                summ_docs = {d["puuid"]: d for d in db.summoners.find(
+                    {"puuid": {"$in": list(puuids)}}, SUMMONER_PROJECTION)}
+
+            for task in tasks:
+                # A drained batch is already LTRIMmed off the queue, so one
+                # failing task must not abandon the rest of it: contain each
+                # task's errors and always settle its job counter.
+                try:
+                    action = task.get("action")
+
+                    if action == "extract_batch":
+                        puuid = task.get("puuid")
+                        start = task.get("start", 0)
+                        count = task.get("count", 100)
+                        update_p = task.get("update_profile", False)
+
+                        run_batch_extraction(puuid, start, count, update_p,
+                                             summ=summ_docs.get(puuid))
+
+                    elif action == "refresh_all":
+                        limit = task.get("limit", 100)
+                        run_extraction_job(limit)
+                except Exception as e:
+                    log(f"Redis Worker Task Error: {e}")
+                finally:
+                    job_id = task.get("job_id")
+                    if job_id:
+                        try:
+                            redis_client.decr(f"job:{job_id}:pending")
+                        except Exception:
+                            pass
 
         except Exception as e:
             log(f"Redis Worker Error: {e}")
@@ -499,8 +914,8 @@ def redis_worker():
 async def lifespan(_app: FastAPI):
     log(f"Validating API Key: {RIOT_API_KEY[:5]}...")
     try:
-        test_url = f"https://euw1.api.riotgames.com/lol/status/v4/platform-data?api_key={RIOT_API_KEY}"
-        r = requests.get(test_url, timeout=5)
+        test_url = STATUS_URL
+        r = SESSION.get(test_url, timeout=5)
         if r.status_code == 200:
             log("API Key is VALID")
         else:
@@ -509,15 +924,24 @@ async def lifespan(_app: FastAPI):
         log(f"Startup Network Check Failed (Offline?): {e}")
         log("Service starting anyway to await connectivity...")
 
-    try:
-        db.matches_raw.create_index("matchId", unique=True)
-    except Exception:
-        pass
+    # One try per index so a failure (e.g. the unique matchId index on a
+    # legacy DB still holding duplicates) doesn't skip the rest.
+    for coll, keys, kwargs in (
+            (db.matches_raw, "matchId", {"unique": True}),
+            (db.matches_raw, [("puuid", 1), ("timestamp", -1)], {}),
+            (db.summoners, "puuid", {"unique": True}),
+            (db.summoners, "last_rank_update", {}),
+    ):
+        try:
+            coll.create_index(keys, **kwargs)
+        except Exception as e:
+            log(f"Index creation failed ({coll.name}/{keys}): {e}")
 
     threading.Thread(target=redis_worker, daemon=True).start()
 
     scheduler = BackgroundScheduler()
-    scheduler.add_job(run_extraction_job, 'interval', minutes=10)
+    scheduler.add_job(run_extraction_job, 'interval', minutes=10, max_instances=1,
+                      kwargs={"only_stale": True})
     scheduler.start()
 
     log("Extractor Service Ready")
@@ -549,7 +973,45 @@ def manual_trigger(background_tasks: BackgroundTasks, count: int = 50, puuid: st
         puuid (str, optional): Target specific user. Defaults to None (all users).
 
     Returns:
-        dict: Status message indicating job started.
+        dict: Status message and a job_id usable with /trigger_extract/{job_id}/wait.
+    """
+    job_id = uuid.uuid4().hex
+    # The counter must exist before the job_id reaches the client: the
+    # background task only starts after this response is sent, and a client
+    # going straight to /wait would otherwise race the summoner scan and
+    # read unknown_job. "enqueuing" marks a job whose fan-out hasn't run
+    # yet; run_extraction_job overwrites it with the real task count.
+    try:
+        redis_client.set(f"job:{job_id}:pending", "enqueuing", ex=3600)
+    except Exception:
+        pass
+    background_tasks.add_task(run_extraction_job, limit=count, target_puuid=puuid, job_id=job_id)
+    return {"status": "Job started", "job_id": job_id}
+
+
+@app.get("/trigger_extract/{job_id}/wait")
+async def wait_for_job(job_id: str, timeout: int = 25):
+    """
+    Long-polls a manual extraction job: returns as soon as every batch the
+    job enqueued has been processed, or 204 after `timeout` seconds so the
+    client simply reconnects instead of polling on a fixed interval.
+
+    Args:
+        job_id (str): The id returned by /trigger_extract.
+        timeout (int, optional): Max seconds to hold the request. Defaults to 25.
+
+    Returns:
+        dict | Response: Job status, or an empty 204 on timeout.
     """
-    background_tasks.add_task(run_extraction_job, limit=count, target_puuid=puuid)
-    return {"status": "Job started"}
\ No newline at end of file
+    key = f"job:{job_id}:pending"
+    deadline = time.monotonic() + min(timeout, 55)
+    while time.monotonic() < deadline:
+        val = redis_client.get(key)
+        if val is None:
+            return {"status": "unknown_job"}
+        # "enqueuing" means the trigger endpoint created the job but its
+        # fan-out hasn't set the real task count yet: keep polling.
+        if val != "enqueuing" and int(val) <= 0:
+            return {"status": "done"}
+        await asyncio.sleep(0.5)
+    return Response(status_code=204)
@@ -6,6 +6,8 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from contextlib import asynccontextmanager
 import sys
 import unicodedata
+import json
+import zlib
 
 load_dotenv()
 
@@ -88,6 +90,12 @@ def run_transform_job():
 
     for raw in raw_matches:
         data = raw.get("raw")
+        if data is None and raw.get("raw_z") is not None:
+            # Newer extractors store a zlib-compressed subset of the payload.
+            try:
+                data = json.loads(zlib.decompress(raw["raw_z"]))
+            except Exception:
+                data = None
         match_id = raw.get("matchId")
         # This is the "Master" PUUID (Key #1)
         db_puuid = raw.get("puuid")